@@ -1,10 +1,24 @@
 import asyncio
-import json
-import sys
 import os
+import shlex
+import signal
 import base64
+import socket
+import struct
+import sys
+from collections import deque
+from functools import partial, wraps
 
 import asyncssh
+import orjson
+# use a libuv event loop where one is installed, uvloop doesnt support windows but winloop does
+try:
+    if sys.platform == "win32":
+        import winloop as uvloop
+    else:
+        import uvloop
+except ImportError:
+    uvloop = None
 from screeninfo import get_monitors
 import PySimpleGUI as sg
 
@@ -16,20 +30,141 @@ FW_PRINTENV_S9 = os.path.join(os.getcwd(), "files", "system", "fw_printenv")
 FIRMWARE_PATH_S9 = os.path.join(os.getcwd(), "files", "firmware")
 UPDATE_FILE_S9 = os.path.join(os.getcwd(), "files", "update.tar")
 CONFIG_FILE = os.path.join(os.getcwd(), "files", "config.toml")
+UNLOCK_FILE = os.path.join(os.getcwd(), "files", "asicseer_installer.exe")
+
+# read the small files sent to every miner once, keyed by path, skipping any that dont exist
+ARTIFACTS = {}
+for artifact_path in [LIB_FILE_S9, SFTP_SERVER_S9, FW_PRINTENV_S9, CONFIG_FILE, REFERRAL_FILE_S9]:
+    if os.path.exists(artifact_path):
+        with open(artifact_path, "rb") as artifact_file:
+            ARTIFACTS[artifact_path] = artifact_file.read()
+
+# define the miners on the testbench, each gets its own controls and output in the GUI
+MINER_IPS = ['192.168.1.11', '192.168.1.12', '192.168.1.13', '192.168.1.14']
+
+# define bytes per transfer read/write request, asyncssh keeps its default of 128 requests in flight
+SFTP_BLOCK_SIZE = 32768
+
+# define how many random bytes are in a HWID, and the characters used in place of + and / when encoding it
+HWID_SIZE = 12
+HWID_ALTCHARS = b'ab'
+
+# define the linger option to reset a connection on close, windows uses two shorts instead of two ints
+LINGER_RESET = struct.pack('HH' if sys.platform == 'win32' else 'ii', 1, 0)
+
+# define how often every miner's HTTP port is pinged, in seconds, and the longest wait for a finished miner
+PING_INTERVAL = 3
+IDLE_PING_INTERVAL = 10
+
+# define how long to wait for a miner to go down after the install reboot, in seconds
+REBOOT_DOWN_TIMEOUT = 60
+
+# define how many times to try the miner API before giving up, and the largest reply it can send
+API_ATTEMPTS = 4
+API_READ_LIMIT = 1024 * 1024
+
+# define how many miners can be setting up an ssh connection at once, and how long a connection can take
+SSH_CONCURRENCY = 2
+SSH_CONNECT_TIMEOUT = 10
+
+# define ssh options in one place for the connection to every miner, asyncssh rebuilds them on each connect
+# keepalives let asyncssh notice a dead connection after 3 missed replies, so it can be replaced
+# prefer aes128, which is cheap on both ends, and never compress, the firmware is already compressed
+# the later ciphers and macs are fallbacks for older dropbear builds on stock firmware
+SSH_OPTIONS = asyncssh.SSHClientConnectionOptions(known_hosts=None, server_host_key_algs=['ssh-rsa'],
+                                                  keepalive_interval=15, keepalive_count_max=3,
+                                                  encryption_algs=['aes128-gcm@openssh.com', 'aes128-ctr',
+                                                                   'aes256-ctr', 'aes128-cbc'],
+                                                  mac_algs=['hmac-sha2-256', 'hmac-sha1'],
+                                                  compression_algs=['none'])
+
+# define how often the GUI is polled for events and output, in seconds, and how often while nothing is happening
+GUI_POLL_INTERVAL = 0.05
+GUI_IDLE_POLL_INTERVAL = 0.1
+# define how many lines of output each miner keeps
+MAX_OUTPUT_LINES = 500
+
+
+# random bytes that HWIDs are taken from, refilled with one read when they run out
+hwid_pool = bytearray()
+
+
+def generate_hwid() -> str:
+    """
+    Generate a random HWID to be used in an install
+    """
+    # refill the pool, 240 bytes is enough for 20 HWIDs
+    if len(hwid_pool) < HWID_SIZE:
+        hwid_pool.extend(os.urandom(HWID_SIZE * 20))
+    # take the next HWID worth of bytes out of the pool
+    hwid = bytes(hwid_pool[:HWID_SIZE])
+    del hwid_pool[:HWID_SIZE]
+    return base64.b64encode(hwid, HWID_ALTCHARS).decode('ascii')
+
+
+def pausable(func):
+    """
+    Wait for the miner to be resumed before running the decorated method
+    """
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        # pause logic
+        await self.wait_if_paused()
+        return await func(self, *args, **kwargs)
+    return wrapper
+
+
+class MinerSSHClient(asyncssh.SSHClient):
+    def __init__(self, miner) -> None:
+        # set miner that owns the connection
+        self.miner = miner
+        # set connection, given to us once it is made
+        self.conn = None
+
+    def connection_made(self, conn: asyncssh.SSHClientConnection) -> None:
+        """
+        Save the connection so it can be matched when it is lost
+        """
+        self.conn = conn
+
+    def connection_lost(self, exc: Exception) -> None:
+        """
+        Forget the saved connection on the miner so the next command reconnects
+        """
+        if self.miner.conn is self.conn:
+            self.miner.conn = None
+            self.miner.sftp = None
 
 
 class Miner:
-    def __init__(self, ip: str, num: int) -> None:
+    def __init__(self, ip: str, num: int, ssh_limit: asyncio.Semaphore, output=print) -> None:
         # set IP of miner
         self.ip = ip
         # set numbered ID of miner
         self.num = num
+        # set the semaphore shared by all miners, limits how many ssh connections are being set up at once
+        self.ssh_limit = ssh_limit
+        # set a queue of states requested by the user from the GUI
+        self.actions = asyncio.Queue()
         # set an event to handle pauses
         self.running = asyncio.Event()
         # set running, otherwise it will block
         self.running.set()
         # set connection to the miner up, cant be created here
         self.conn = None
+        # set sftp client up, shares the connection above
+        self.sftp = None
+        # lock to stop two commands from creating a connection at the same time
+        self.conn_lock = asyncio.Lock()
+        # set API connection streams up, kept open between commands when the miner allows it
+        self.api_reader = None
+        self.api_writer = None
+        # set an event that ping_all sets while the HTTP port of the miner is up
+        self.http_up = asyncio.Event()
+        # set while the miner is finished and waiting to be disconnected, ping_all backs off on it
+        self.idle = False
+        # set where output goes, the GUI passes a buffer it empties on each tick, otherwise it is printed
+        self.output = output
 
     async def pause(self) -> None:
         """
@@ -54,170 +189,271 @@ class Miner:
             self.running.set()
             self.add_to_output("Resumed...")
 
+    async def wait_if_paused(self) -> None:
+        """
+        Block until the miner is resumed, letting the user know if it is paused
+        """
+        # check if we are paused
+        if not self.running.is_set():
+            # tell the user we are waiting
+            self.add_to_output("Paused...")
+        await self.running.wait()
+
     def add_to_output(self, message: str) -> None:
         """
-        Add a message to the output of the GUI
+        Add a message to the output of the miner
         """
-        # append data to the output of the GUI in the corresponding multiline
-        window[f"data_{self.num}"].update(f"[{self.ip}] - {message}\n", append=True)
+        # send the data to the output, the GUI loop appends it to the corresponding multiline in one update
+        self.output(f"[{self.ip}] - {message}")
 
-    async def get_connection(self, username: str, password: str) -> asyncssh.connect:
+    async def get_connection(self, username: str, password: str) -> asyncssh.SSHClientConnection:
         """
-        Create a new asyncssh connection and save it
+        Create a new asyncssh connection and save it, or return the saved one if it is still open
         """
-        if self.conn is None:
-            # if connection doesnt exist, create it
-            conn = await asyncssh.connect(self.ip, known_hosts=None, username=username, password=password,
-                                          server_host_key_algs=['ssh-rsa'])
-            # return created connection
-            self.conn = conn
-        else:
-            # if connection exists, return the connection
-            conn = self.conn
-        return conn
+        async with self.conn_lock:
+            if self.conn is None:
+                # if connection doesnt exist, create it, waiting for a free slot so only a few miners dial at once
+                # the client clears self.conn if the miner drops the connection
+                async with self.ssh_limit:
+                    # asyncssh has no connect timeout, so a miner that is down cant hold the slot for long
+                    conn = await asyncio.wait_for(
+                        asyncssh.connect(self.ip, username=username, password=password, options=SSH_OPTIONS,
+                                         client_factory=lambda: MinerSSHClient(self)),
+                        timeout=SSH_CONNECT_TIMEOUT)
+                # save created connection
+                self.conn = conn
+            # return the connection
+            return self.conn
+
+    async def get_sftp(self) -> asyncssh.SFTPClient:
+        """
+        Create a new sftp client on the saved connection and save it, or return the saved one
+        """
+        # get/create ssh connection to miner
+        conn = await self.get_connection("root", "admin")
+        if self.sftp is None:
+            # if sftp client doesnt exist, create it over the existing connection
+            self.sftp = await conn.start_sftp_client()
+        return self.sftp
 
+    def drop_connection(self) -> None:
+        """
+        Forget the ssh connection and sftp client so the next command creates new ones
+        """
+        if self.conn is not None:
+            # dont wait for the close, the connection is likely broken
+            self.conn.close()
+        self.conn = None
+        self.sftp = None
+
+    async def close(self) -> None:
+        """
+        Close the API connection, sftp client, and ssh connection to the miner
+        """
+        # close the API connection
+        await self.close_api_connection()
+        if self.sftp is not None:
+            # close the sftp channel
+            self.sftp.exit()
+            await self.sftp.wait_closed()
+            self.sftp = None
+        if self.conn is not None:
+            # close the ssh connection
+            self.conn.close()
+            await self.conn.wait_closed()
+            self.conn = None
+
+    @pausable
     async def ping(self, port: int) -> bool:
         """
-        Ping a port on the miner, used by ping_ssh and ping_http
+        Ping a port on the miner, 80 for HTTP and 22 for SSH
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
+        return await self.check_port(port)
+
+    @pausable
+    async def ping_http(self) -> bool:
+        """
+        Check if the HTTP port of the miner was up the last time ping_all checked it
+        """
+        return self.http_up.is_set()
 
-        # open a connection to the miner on specified port
-        connection_fut = asyncio.open_connection(self.ip, port)
+    async def check_port(self, port: int) -> bool:
+        """
+        Check if a port on the miner accepts connections, without waiting if the miner is paused
+        """
+        # create a bare non-blocking socket, we only need to know if the port accepts a connection
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
         try:
-            # get the read and write streams from the connection
-            reader, writer = await asyncio.wait_for(connection_fut, timeout=1)
-            # immediately close connection, we know connection happened
-            writer.close()
-            # make sure the writer is closed
-            await writer.wait_closed()
+            # connect to the miner on specified port
+            await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (self.ip, port)), timeout=1)
+            # reset the connection on close instead of going through the FIN handshake, we have nothing to send
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RESET)
             # ping was successful
             return True
         except asyncio.exceptions.TimeoutError:
             # ping failed if we time out
             return False
-        except ConnectionRefusedError:
-            # handle for other connection errors
-            self.add_to_output("Unknown error...")
-        # ping failed, likely with an exception
-        return False
-
-    async def ping_http(self) -> bool:
-        """
-        Ping the HTTP port of the miner
-        """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-
-        # ping port 80 (HTTP)
-        if await self.ping(80):
-            # ping returned true, HTTP is up
-            return True
-        else:
-            # ping returned false, HTTP is down
+        except OSError:
+            # refused, unreachable or similar, the miner is not up, the run loop tells the user
             return False
+        finally:
+            # immediately close connection, we know if the connection happened
+            sock.close()
 
     async def wait_for_disconnect(self) -> None:
         """
         Wait for the miner to disconnect
         """
         self.add_to_output('Waiting for disconnect...')
-        while await self.ping_http():
-            # pause logic
-            if not self.running.is_set():
-                self.add_to_output("Paused...")
-            await self.running.wait()
-            await asyncio.sleep(1)
-
-    async def ping_ssh(self) -> bool:
-        """
-        Ping the SSH port of the miner
-        """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-
-        # ping port 22 (SSH)
-        if await self.ping(22):
-            # ping returned true, SSH is up
-            return True
-        else:
-            # ping returned false, SSH is down
-            return False
-
+        # let ping_all back off while we wait
+        self.idle = True
+        try:
+            # ping_all keeps the HTTP state up to date, so this only checks it, ping_http waits if we are paused
+            while await self.ping_http():
+                # stop waiting if the user asked for something to be done
+                if not self.actions.empty():
+                    return
+                await asyncio.sleep(1)
+        finally:
+            self.idle = False
+
+    @pausable
     async def get_version(self) -> str:
         """
         Get the version of the miner
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-
         # tell the user we are getting the version
         self.add_to_output("Getting version...")
-        retries = 0
-        while True:
-            # open a connection to the [cgminer, bmminer, bosminer] API port (4028)
-            connection_fut = asyncio.open_connection(self.ip, 4028)
+        # try a few times, the API can refuse connections while the miner is starting
+        for attempt in range(API_ATTEMPTS):
             try:
-                # get reader and writer streams from connection
-                reader, writer = await asyncio.wait_for(connection_fut, timeout=5)
-                # send the standard version command (JSON)
-                writer.write(b'{"command":"version"}')
-                # wait until command is finished sending
-                await writer.drain()
-                # read the returned data
-                data = await reader.read(4096)
+                # send the standard version command (JSON) and read the returned data
+                data = await self.send_api_command("version")
                 # let the user know we recieved data
                 self.add_to_output("Recieved data...")
-                # close the writer
-                writer.close()
-                # make sure the writer is fully closed
-                await writer.wait_closed()
-                # load the returned data (JSON), and remove the null byte at the end
-                data_dict = json.loads(data[:-1].decode('utf-8'))
-                # tell the user the version of the miner
-                self.add_to_output(f'Version is {data_dict["VERSION"][0][list(data_dict["VERSION"][0].keys())[1]]}...')
-                if "BOSminer+" in data_dict["VERSION"][0].keys() or "BOSminer" in data_dict["VERSION"][0].keys():
-                    return "BOS+"
-                else:
-                    return "Antminer"
-            except asyncio.exceptions.TimeoutError:
-                # we have no version, the connection timed out
+                return self.parse_version(data)
+            except (asyncio.exceptions.TimeoutError, asyncio.LimitOverrunError):
+                # we have no version, the connection timed out or the reply was too big
                 self.add_to_output("Get version failed...")
                 return False
-            except ConnectionRefusedError:
-                # add to retry times
-                retries += 1
+            except (ConnectionError, asyncio.IncompleteReadError):
                 # connection was refused, tell the user
                 self.add_to_output("Connection refused, retrying...")
-                # make sure it doesnt get stuck here
-                if retries > 3:
-                    self.add_to_output('Connection refused, attempting install...')
-                    return "Antminer"
+                # back off before retrying, 1, 2, 4... seconds
+                if attempt < API_ATTEMPTS - 1:
+                    await asyncio.sleep(2 ** attempt)
+        # make sure it doesnt get stuck here
+        self.add_to_output('Connection refused, attempting install...')
+        return "Antminer"
+
+    @pausable
+    async def get_api_version(self) -> str:
+        """
+        Get the version of the miner over an API connection that is already open, used as a heartbeat
+        """
+        # dont open a new connection, the pings are cheaper than an API connection that times out
+        if not self.api_connected():
+            return None
+        try:
+            # send the standard version command (JSON) and read the returned data
+            data = await self.send_api_command("version", timeout=1)
+        except (asyncio.exceptions.TimeoutError, OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            # the connection is gone, fall back to pinging the miner
+            return None
+        return self.parse_version(data)
+
+    def parse_version(self, data: bytes) -> str:
+        """
+        Parse the reply to the version command, and tell the user the version of the miner
+        """
+        # load the returned data (JSON), and remove the null byte at the end
+        version = orjson.loads(data[:-1])["VERSION"][0]
+        # BraiinsOS reports its version under its own key, other firmware under the first key
+        is_bos = "BOSminer+" in version or "BOSminer" in version
+        name = version.get("BOSminer+") or version.get("BOSminer") or next(
+            (value for key, value in version.items() if key != "STATUS"), "unknown")
+        # tell the user the version of the miner
+        self.add_to_output(f'Version is {name}...')
+        if is_bos:
+            return "BOS+"
+        else:
+            return "Antminer"
+
+    def api_connected(self) -> bool:
+        """
+        Check if the saved connection to the miner API is still usable
+        """
+        # the API can close the connection after each reply
+        return self.api_writer is not None and not self.api_writer.is_closing() and not self.api_reader.at_eof()
+
+    async def get_api_connection(self, timeout: float = 5) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """
+        Create a new connection to the miner API and save it, or return the saved one if it is still open
+        """
+        if not self.api_connected():
+            # drop the old connection if there is one
+            await self.close_api_connection()
+            # open a connection to the [cgminer, bmminer, bosminer] API port (4028)
+            # replies are read whole, so allow ones bigger than the default 64KiB stream limit
+            connection_fut = asyncio.open_connection(self.ip, 4028, limit=API_READ_LIMIT)
+            self.api_reader, self.api_writer = await asyncio.wait_for(connection_fut, timeout=timeout)
+        return self.api_reader, self.api_writer
+
+    async def close_api_connection(self) -> None:
+        """
+        Close the saved connection to the miner API
+        """
+        if self.api_writer is not None:
+            # close the writer
+            self.api_writer.close()
+            try:
+                # make sure the writer is fully closed
+                await self.api_writer.wait_closed()
+            except OSError:
+                # connection was already broken, it is closed either way
+                pass
+        self.api_reader = None
+        self.api_writer = None
 
+    async def send_api_command(self, command: str, timeout: float = 5) -> bytes:
+        """
+        Send a command to the miner API and return the reply, including the null byte at the end
+        """
+        # try twice, the saved connection may have been closed by the miner since it was last used
+        for attempt in range(2):
+            reader, writer = await self.get_api_connection(timeout)
+            try:
+                # send the command (JSON)
+                writer.write(orjson.dumps({"command": command}))
+                # wait until command is finished sending
+                await writer.drain()
+                # read the returned data up to the null byte that ends it
+                return await asyncio.wait_for(reader.readuntil(b'\x00'), timeout=timeout)
+            except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+                # the miner closed the connection, drop it and retry on a new one
+                await self.close_api_connection()
+                if attempt:
+                    raise
+            except BaseException:
+                # dont reuse a connection that is in an unknown state
+                await self.close_api_connection()
+                raise
+
+    @pausable
     async def run_command(self, cmd: str) -> None:
         """
         Run a command on the miner
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-
         # get/create ssh connection to miner
         conn = await self.get_connection("root", "admin")
         # send the command and store the result
         try:
             result = await conn.run(cmd)
-        except:
+        except (asyncssh.Error, OSError):
+            # the connection has died, replace it and retry once
+            self.drop_connection()
+            conn = await self.get_connection("root", "admin")
             result = await conn.run(cmd)
         # let the user know the result of the command
         if result.stdout != "":
@@ -227,79 +463,114 @@ class Miner:
         else:
             self.add_to_output(cmd)
 
+    @pausable
     async def send_dir(self, l_dir: str, r_dest: str) -> None:
         """
         Send a directory to a miner
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-
         # tell the user we are sending a file to the miner
         self.add_to_output(f"Sending directory to {self.ip}...")
-        # get/create ssh connection to miner
-        conn = await self.get_connection("root", "admin")
-        # create sftp client using ssh connection
-        async with conn.start_sftp_client() as sftp:
-            # send a file over sftp
-            await sftp.put(l_dir, remotepath=r_dest, recurse=True)
+        # get/create sftp client on the ssh connection to miner
+        sftp = await self.get_sftp()
+        # send a directory over sftp
+        await sftp.put(l_dir, remotepath=r_dest, recurse=True, block_size=SFTP_BLOCK_SIZE)
         # tell the user the file was sent to the miner
         self.add_to_output(f"Directory sent...")
 
-    async def send_file(self, l_file: str, r_dest: str) -> None:
+    @pausable
+    async def send_file(self, l_file: str, r_dest: str, scp: bool = False, executable: bool = False) -> None:
         """
-        Send a file to a miner
+        Send a file to a miner, over scp if the miner may not have an sftp server yet
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
+        if l_file in ARTIFACTS:
+            # the file was read at startup, so write it from memory, this needs no sftp server
+            await self.upload_bytes(ARTIFACTS[l_file], r_dest, executable)
+            return
+        if scp:
+            # get/create ssh connection to miner
+            conn = await self.get_connection("root", "admin")
+            # send file over scp
+            await asyncssh.scp(l_file, (conn, r_dest), block_size=SFTP_BLOCK_SIZE)
+        else:
+            # get/create sftp client on the ssh connection to miner
+            sftp = await self.get_sftp()
+            # send file over sftp, reusing the same channel as every other transfer
+            await sftp.put(l_file, remotepath=r_dest, block_size=SFTP_BLOCK_SIZE)
+        if executable:
+            # add execute permissions to the file
+            conn = await self.get_connection("root", "admin")
+            await conn.run(f"chmod +x {shlex.quote(r_dest)}", check=True)
+        self.add_to_output(f"File sent...")
 
-        # cget/create ssh connection to miner
+    async def upload_bytes(self, data: bytes, r_dest: str, executable: bool = False) -> None:
+        """
+        Write data to a file on a miner with cat, adding execute permissions in the same command if needed
+        """
+        cmd = f"cat > {shlex.quote(r_dest)}"
+        if executable:
+            cmd += f" && chmod +x {shlex.quote(r_dest)}"
+        # get/create ssh connection to miner
         conn = await self.get_connection("root", "admin")
-        # send file over scp
-        await asyncssh.scp(l_file, (conn, r_dest))
+        try:
+            # one exec channel, the data is streamed to cat on stdin, raise if it fails like scp and sftp do
+            await conn.run(cmd, input=data, encoding=None, check=True)
+        except asyncssh.ProcessError as e:
+            # let the user know why the file could not be written before passing the error on
+            self.add_to_output("ERROR: " + e.stderr.decode('utf-8', errors='replace'))
+            raise
         self.add_to_output(f"File sent...")
 
+    @pausable
     async def get_file(self, r_file: str, l_dest: str) -> None:
         """
         Copy a file from a miner
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-
         # tell the user we are copying a file from the miner
         self.add_to_output(f"Copying file from {self.ip}...")
-        # create ssh connection to miner
-        conn = await self.get_connection("root", "admin")
-        # create sftp client using ssh connection
-        async with conn.start_sftp_client() as sftp:
-            # copy a file over sftp
-            await sftp.get(r_file, localpath=l_dest)
+        # get/create sftp client on the ssh connection to miner
+        sftp = await self.get_sftp()
+        # copy a file over sftp
+        await sftp.get(r_file, localpath=l_dest, block_size=SFTP_BLOCK_SIZE)
         # tell the user we copied the file from the miner
         self.add_to_output(f"File copied...")
 
+    @pausable
     async def ssh_unlock(self) -> bool:
         """
         Unlock the SSH of a miner
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-
-        # have to outsource this to another program
-        proc = await asyncio.create_subprocess_shell(
-            f'{os.path.join(os.getcwd(), "files", "asicseer_installer.exe")} -p -f {self.ip} root',
+        # have to outsource this to another program, run it directly without a shell
+        proc = await asyncio.create_subprocess_exec(
+            UNLOCK_FILE, "-p", "-f", self.ip, "root",
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE)
-        # get stdout of the unlock
-        stdout, _ = await proc.communicate()
-        # check if the webUI password needs to be reset
-        if str(stdout).find("webUI") != -1:
+            stderr=asyncio.subprocess.DEVNULL)
+        # read stdout of the unlock line by line as it runs
+        needs_reset = False
+        try:
+            async for line in proc.stdout:
+                # show the unlock output to the user, this is buffered so it doesnt hold up the unlock
+                line = line.decode('utf-8', errors='replace').strip()
+                if line:
+                    self.add_to_output(line)
+                # check if the webUI password needs to be reset
+                if "webUI" in line:
+                    needs_reset = True
+                    # no need to wait for the rest, the unlock has failed
+                    break
+            if not needs_reset:
+                # the unlock finished its output, let it exit on its own
+                await proc.wait()
+        finally:
+            # stop the unlock if it is still running, including when we are cancelled on shutdown
+            if proc.returncode is None:
+                try:
+                    proc.terminate()
+                except ProcessLookupError:
+                    # process already exited on its own
+                    pass
+            # make sure the process has exited
+            await proc.wait()
+        if needs_reset:
             # tell the user to reset the webUI password
             self.add_to_output("SSH unlock failed, please reset miner with reset button...")
             # ssh unlock failed
@@ -310,25 +581,23 @@ class Miner:
             # ssh is unlocked
             return True
 
+    @pausable
     async def send_referral(self) -> None:
         """
         Send the referral IPK to a miner
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-        # check if the referral file exists
-        if os.path.exists(REFERRAL_FILE_S9):
+        # check if the referral file existed when we started
+        if REFERRAL_FILE_S9 in ARTIFACTS:
             try:
                 # tell the user we are sending the referral
                 self.add_to_output("Sending referral IPK...")
-                # create ssh connection to miner
+                # send the referral and config, both from memory
+                # they dont depend on each other, so send them at the same time
+                await asyncio.gather(self.send_file(REFERRAL_FILE_S9, '/tmp/referral.ipk'),
+                                     self.send_file(CONFIG_FILE, '/etc/bosminer.toml'))
+                # get/create ssh connection to miner
                 conn = await self.get_connection("root", "admin")
-                # create sftp client using ssh connection
-                await self.send_file(REFERRAL_FILE_S9, '/tmp/referral.ipk')
-                await self.send_file(CONFIG_FILE, '/etc/bosminer.toml')
-
+                # install the referral and restart on another channel of the same ssh connection
                 result = await conn.run(f'opkg install /tmp/referral.ipk && /etc/init.d/bosminer restart')
                 self.add_to_output(result.stdout.strip())
                 # tell the user the referral completed
@@ -338,24 +607,19 @@ class Miner:
         else:
             self.add_to_output("No referral file, skipping referral install")
 
+    @pausable
     async def update(self) -> None:
         """
         Run the update process on the miner
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-
         # tell the user we are updating
         self.add_to_output(f"Updating...")
-        # create ssh connection to miner
         try:
-            conn = await self.get_connection("root", "admin")
             # tell the user we are sending the update file
             self.add_to_output("Sending upgrade file...")
-            # send the update file
+            # send the update file, this creates the ssh connection to miner
             await self.send_file(UPDATE_FILE_S9, "/tmp/firmware")
+            conn = await self.get_connection("root", "admin")
             # install the update and collect the result
             result = await conn.run(f'sysupgrade /tmp/firmware.tar')
             self.add_to_output(result.stdout.strip())
@@ -364,75 +628,33 @@ class Miner:
         except OSError:
             self.add_to_output(f"Unknown error...")
 
+    @pausable
     async def install(self) -> None:
         """
         Run the braiinsOS installation process on the miner
         """
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-        # remove temp firmware directory, making sure its empty
-        await self.run_command("rm -fr /tmp/firmware")
-        # recreate temp firmware directory
-        await self.run_command("mkdir -p /tmp/firmware")
-
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-        # ensure lib exists
-        await self.run_command("mkdir -p /lib")
-        # copy ld-musl-armhf.so.1 to lib
-        await self.send_file(LIB_FILE_S9, "/lib/ld-musl-armhf.so.1")
-        # add execute permissions to /lib/ld-musl-armhf.so.1
-        await self.run_command("chmod +x /lib/ld-musl-armhf.so.1")
-
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-        # create openssh directory in /usr/lib/openssh
-        await self.run_command("mkdir -p /usr/lib/openssh")
-        # copy sftp-server to /usr/lib/openssh/sftp-server
-        await self.send_file(SFTP_SERVER_S9, "/usr/lib/openssh/sftp-server")
-        # add execute permissions to /usr/lib/openssh/sftp-server
-        await self.run_command("chmod +x /usr/lib/openssh/sftp-server")
-
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-        # ensure /usr/sbin exists
-        await self.run_command("mkdir -p /usr/sbin")
-        # copy fw_printenv to /usr/sbin/fw_printenv
-        await self.send_file(FW_PRINTENV_S9, "/usr/sbin/fw_printenv")
-        # add execute permissions to /usr/sbin/fw_printenv
-        await self.run_command("chmod +x /usr/sbin/fw_printenv")
-
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-        # copy over firmware files to /tmp/firmware
+        # remove temp firmware directory, making sure its empty, and create every directory we copy to
+        # also link fw_setenv to fw_printenv now, the link works once fw_printenv is sent
+        await self.run_command("rm -fr /tmp/firmware && mkdir -p /tmp/firmware /lib /usr/lib/openssh /usr/sbin"
+                               " && ln -fs /usr/sbin/fw_printenv /usr/sbin/fw_setenv")
+
+        # stock firmware has no sftp server until these are sent, so they are written from memory, or use scp
+        # they dont depend on each other, so send them at the same time, adding execute permissions as they are sent
+        await asyncio.gather(
+            # copy ld-musl-armhf.so.1 to lib
+            self.send_file(LIB_FILE_S9, "/lib/ld-musl-armhf.so.1", scp=True, executable=True),
+            # copy sftp-server to /usr/lib/openssh/sftp-server
+            self.send_file(SFTP_SERVER_S9, "/usr/lib/openssh/sftp-server", scp=True, executable=True),
+            # copy fw_printenv to /usr/sbin/fw_printenv
+            self.send_file(FW_PRINTENV_S9, "/usr/sbin/fw_printenv", scp=True, executable=True))
+
+        # copy over firmware files to /tmp/firmware, sftp works now
         await self.send_dir(FIRMWARE_PATH_S9, "/tmp")
-        # add execute permissions to firmware stage 1
-        await self.run_command("chmod +x /tmp/firmware/stage1.sh")
-
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
-        await self.run_command("ln -fs /usr/sbin/fw_printenv /usr/sbin/fw_setenv")
 
-        # pause logic
-        if not self.running.is_set():
-            self.add_to_output("Paused...")
-        await self.running.wait()
         # generate random HWID to be used in install
-        hwid = base64.b64encode(os.urandom(12), b'ab').decode('ascii')
-        # generate install command
-        install_cmd = f"cd /tmp/firmware && ls -l && /bin/sh stage1.sh \
+        hwid = generate_hwid()
+        # generate install command, adding execute permissions to firmware stage 1 first
+        install_cmd = f"chmod +x /tmp/firmware/stage1.sh && cd /tmp/firmware && ls -l && /bin/sh stage1.sh \
         '{hwid}' \
         'UpstreamDataInc.test' \
         '900' \
@@ -445,25 +667,53 @@ class Miner:
         # run the install
         await self.run_command(f"{install_cmd} && /sbin/reboot")
         # close ssh connection on our own, we know it will fail if not
-        if self.conn is not None:
-            self.conn.close()
-            await self.conn.wait_closed()
-            self.conn = None
-        # wait 120 seconds for reboot
+        await self.close()
+        # wait for reboot, progress is reported against the usual 80 seconds
         self.add_to_output('Rebooting...')
-        await asyncio.sleep(20)
-        self.add_to_output("25% Complete...")
-        await asyncio.sleep(20)
-        self.add_to_output("50% Complete...")
-        await asyncio.sleep(20)
-        self.add_to_output("75% Complete...")
-        await asyncio.sleep(20)
-        self.add_to_output("Reboot Complete...")
+        start = asyncio.get_running_loop().time()
+        # wait for the miner to go down before checking if it is back up, ping_all only updates every few seconds
+        while await self.ping_http():
+            if asyncio.get_running_loop().time() - start > REBOOT_DOWN_TIMEOUT:
+                # the web server never went down, so the reboot didnt happen, let run start over with the checks
+                raise OSError("Miner did not go down for reboot")
+            await asyncio.sleep(1)
+        last_quarter = 0
         while not await self.ping_http():
-            await asyncio.sleep(3)
+            # tell the user each time another 20 seconds have passed
+            quarter = min(3, int((asyncio.get_running_loop().time() - start) / 20))
+            if quarter > last_quarter:
+                self.add_to_output(f"{quarter * 25}% Complete...")
+                last_quarter = quarter
+            await asyncio.sleep(2)
+        self.add_to_output("Reboot Complete...")
         await asyncio.sleep(5)
 
 
+async def ping_all(miner_list: list) -> None:
+    """
+    Ping the HTTP port of every miner at once on a fixed interval, and save the result on each miner
+    """
+    loop = asyncio.get_running_loop()
+    # save when each finished miner is next pinged, and the delay it is backed off to
+    next_ping = {miner: 0 for miner in miner_list}
+    delay = {miner: PING_INTERVAL for miner in miner_list}
+    while True:
+        now = loop.time()
+        # skip paused miners, and finished miners until their backed off delay is up
+        due = [miner for miner in miner_list if miner.running.is_set() and (not miner.idle or next_ping[miner] <= now)]
+        # ping every miner together, so one timing out doesnt hold up the others
+        results = await asyncio.gather(*(miner.check_port(80) for miner in due), return_exceptions=True)
+        for miner, http_up in zip(due, results):
+            if http_up is True:
+                miner.http_up.set()
+            else:
+                miner.http_up.clear()
+            # back off by 1.5x each ping while the miner is finished, otherwise ping it every interval
+            delay[miner] = min(delay[miner] * 1.5, IDLE_PING_INTERVAL) if miner.idle else PING_INTERVAL
+            next_ping[miner] = now + delay[miner]
+        await asyncio.sleep(PING_INTERVAL)
+
+
 async def run(miner: Miner) -> None:
     """
     Main run loop for the testing process of the miner
@@ -472,163 +722,239 @@ async def run(miner: Miner) -> None:
     main_state = "start"
     # start the main loop
     while True:
-        await asyncio.sleep(3)
-        # check state
-        if main_state == "start":
-            # Check for http
-            if await miner.ping_http():
-                # check for ssh if http works
-                if await miner.ping_ssh():
-                    # if both ssh and http are up, the miner is on and unlocked
-                    miner.add_to_output('SSH Connected...')
-                    # check if BraiinsOS is already on the miner
-                    if await miner.get_version() == "BOS+":
-                        miner.add_to_output('BraiinsOS+ is already installed!')
-                        # set state to update BraiinsOS, skip install
-                        main_state = "update"
-                        # restart the while loop just to be safe
-                        continue
+        try:
+            # wait for the next check, or for the user to ask for a state from the GUI
+            main_state = await asyncio.wait_for(miner.actions.get(), timeout=3)
+        except asyncio.exceptions.TimeoutError:
+            pass
+        # a state can be asked for from the GUI while the miner is down or locked, so catch connection errors
+        try:
+            # check state
+            if main_state == "start":
+                # if the API connection from the last check is still open, it shows the miner is up and what it runs
+                if await miner.get_api_version() == "BOS+":
+                    miner.add_to_output('BraiinsOS+ is already installed!')
+                    # set state to update BraiinsOS, skip install
+                    main_state = "update"
+                    # restart the while loop just to be safe
+                    continue
+                # Check for http, ping_all keeps this up to date
+                if await miner.ping_http():
+                    # check for ssh if http works
+                    if await miner.ping(22):
+                        # if both ssh and http are up, the miner is on and unlocked
+                        miner.add_to_output('SSH Connected...')
+                        # check if BraiinsOS is already on the miner
+                        if await miner.get_version() == "BOS+":
+                            miner.add_to_output('BraiinsOS+ is already installed!')
+                            # set state to update BraiinsOS, skip install
+                            main_state = "update"
+                            # restart the while loop just to be safe
+                            continue
+                        else:
+                            # if BraiinsOS is not installed but ssh is up, move on to installing it over ssh
+                            await asyncio.sleep(5)
+                            main_state = "install"
                     else:
-                        # if BraiinsOS is not installed but ssh is up, move on to installing it over ssh
-                        await asyncio.sleep(5)
-                        main_state = "install"
+                        # miner is on but has no ssh, needs to be unlocked
+                        miner.add_to_output('SSH Disconnected...')
+                        miner.add_to_output('Unlocking...')
+                        # do the unlock
+                        if await miner.ssh_unlock():
+                            # set state to install now that ssh works, ssh_unlock returns True when unlock works
+                            main_state = "install"
+                            # restart the while loop just to be safe
+                            continue
+                        else:
+                            # if ssh unlock fails, it needs to be reset, ssh_unlock will tell the user that and return false, so wait for disconnect
+                            await miner.wait_for_disconnect()
+                            # set state to start to retry after reset
+                            main_state = "start"
+                            # restart the while loop just to be safe
+                            continue
                 else:
-                    # miner is on but has no ssh, needs to be unlocked
-                    miner.add_to_output('SSH Disconnected...')
-                    miner.add_to_output('Unlocking...')
-                    # do the unlock
-                    if await miner.ssh_unlock():
-                        # set state to install now that ssh works, ssh_unlock returns True when unlock works
-                        main_state = "install"
-                        # restart the while loop just to be safe
-                        continue
-                    else:
-                        # if ssh unlock fails, it needs to be reset, ssh_unlock will tell the user that and return false, so wait for disconnect
-                        await miner.wait_for_disconnect()
-                        # set state to start to retry after reset
-                        main_state = "start"
-                        # restart the while loop just to be safe
-                        continue
-            else:
-                # if no http or ssh are present, the miner is off or not ready
-                window[f"data_{miner.num}"].update(f"[{miner.ip}] - Down...\n", append=True)
-        # check state
-        if main_state == "install":
-            # let the user know we are starting install
-            miner.add_to_output('Starting install...')
-            # start install
-            await miner.install()
-            # after install completes, move to sending referral
-            main_state = "referral"
-        # check state
-        if main_state == "update":
-            # start update
-            await miner.update()
-            # after update completes, move to sending referral
-            main_state = "referral"
-        # check state
-        if main_state == "referral":
-            # send the referral file, install it, and configure using config.toml
-            await miner.send_referral()
-            # set state to done to wait for disconnect
-            main_state = "done"
-        # check state
-        if main_state == "done":
-            # wait for the user to disconnect the miner
-            await miner.wait_for_disconnect()
-            # set state to start and restart the process
+                    # if no http or ssh are present, the miner is off or not ready
+                    miner.add_to_output("Down...")
+            # check state
+            if main_state == "install":
+                # let the user know we are starting install
+                miner.add_to_output('Starting install...')
+                # start install
+                await miner.install()
+                # after install completes, move to sending referral
+                main_state = "referral"
+            # check state
+            if main_state == "update":
+                # start update
+                await miner.update()
+                # after update completes, move to sending referral
+                main_state = "referral"
+            # check state
+            if main_state == "referral":
+                # send the referral file, install it, and configure using config.toml
+                await miner.send_referral()
+                # set state to done to wait for disconnect
+                main_state = "done"
+            # check state
+            if main_state == "done":
+                # wait for the user to disconnect the miner
+                await miner.wait_for_disconnect()
+                # set state to start and restart the process
+                main_state = "start"
+                # restart main loop
+                continue
+        except (OSError, asyncssh.Error, asyncio.exceptions.TimeoutError) as e:
+            # let the user know what failed, and start over with the checks
+            miner.add_to_output(f"ERROR: {e}")
             main_state = "start"
-            # restart main loop
-            continue
 
 
-# get screen size in a tuple
-monitor = get_monitors()[0]
+def miner_layout(num: int, output_size: tuple) -> list:
+    """
+    Create the control buttons and output multiline for a miner
+    """
+    return [
+        sg.Column([
+            [sg.Button("Pause", key=f"pause_{num}")],
+            [sg.Button("Resume", key=f"resume_{num}")],
+            [sg.Button("Install", key=f"install_{num}")],
+            [sg.Button("Referral", key=f"referral_{num}")]]),
+        # write only, the output is never read back so PySimpleGUI can skip tracking its value
+        sg.Multiline(key=f"data_{num}", autoscroll=True, disabled=True, write_only=True, size=output_size)]
+
 
-# create window size variables
-win_width = int(monitor.width / 2)
-win_height = int(monitor.height)
+def create_window(miner_count: int) -> sg.Window:
+    """
+    Create the GUI window, sized to the right half of the screen
+    """
+    # get screen size in a tuple
+    monitor = get_monitors()[0]
 
-# create the layout
-layout = [[sg.Pane([
-    sg.Column([[
-        sg.Column([
-            [sg.Button("Pause", key="pause_1")],
-            [sg.Button("Resume", key="resume_1")]]),
-        sg.Multiline(key="data_1", autoscroll=True, disabled=True, size=(int(win_width / 20), int(win_height / 36))),
-        sg.Column([
-            [sg.Button("Pause", key="pause_2")],
-            [sg.Button("Resume", key="resume_2")]]),
-        sg.Multiline(key="data_2", autoscroll=True, disabled=True, size=(int(win_width / 20), int(win_height / 36)))]]),
-    sg.Column([[
-        sg.Column([
-            [sg.Button("Pause", key="pause_3")],
-            [sg.Button("Resume", key="resume_3")]]),
-        sg.Multiline(key="data_3", autoscroll=True, disabled=True, size=(int(win_width / 20), int(win_height / 36))),
-        sg.Column([
-            [sg.Button("Pause", key="pause_4")],
-            [sg.Button("Resume", key="resume_4")]]),
-        sg.Multiline(key="data_4", autoscroll=True, disabled=True, size=(int(win_width / 20), int(win_height / 36)))]])
-], relief=sg.RELIEF_FLAT, show_handle=False)]]
+    # create window size variables
+    win_width = int(monitor.width / 2)
+    win_height = int(monitor.height)
+
+    # two miners per row
+    rows = (miner_count + 1) // 2
+
+    # create the multiline size, in characters, shared by every miner
+    output_size = (int(win_width / 20), int(win_height / (18 * rows)))
+
+    # create the layout, a column for each row of miners
+    layout = []
+    for first in range(1, miner_count + 1, 2):
+        row = []
+        for num in range(first, min(first + 2, miner_count + 1)):
+            row += miner_layout(num, output_size)
+        layout.append([sg.Column([row])])
 
-# create the window
-window = sg.Window('Installer', layout, size=(win_width, win_height), location=(win_width, 0))
+    # create the window
+    return sg.Window('Installer', layout, size=(win_width, win_height), location=(win_width, 0))
 
 
-async def run_gui(miner_list: list) -> None:
+async def run_gui(window: sg.Window, miner_list: list, output_buffers: dict) -> None:
     """
     Run the GUI for the miner installer
     """
+    # map the button events to the miner they belong to
+    handlers = {}
+    for miner in miner_list:
+        handlers[f"pause_{miner.num}"] = miner.pause
+        handlers[f"resume_{miner.num}"] = miner.resume
+        # queue a state for the miner to move to on its next check
+        handlers[f"install_{miner.num}"] = partial(miner.actions.put, "install")
+        handlers[f"referral_{miner.num}"] = partial(miner.actions.put, "referral")
+
+    # set how long to wait before the next poll, this grows while nothing is happening
+    poll_interval = GUI_POLL_INTERVAL
     while True:
-        # event loop for the GUI
-        await asyncio.sleep(0)
-        # read events
-        event, value = window.read(timeout=1)
-        # end program on closing the window
+        # event loop for the GUI, poll at 10-20 times a second so the miners get the rest of the loop
+        # tkinter can only be used from this thread, so the window cant be read in another one
+        await asyncio.sleep(poll_interval)
+        # read events without blocking, we already waited above
+        event, value = window.read(timeout=0)
+        # end program on closing the window, main stops the miners and closes their connections
         if event in (None, 'Cancel'):
-            sys.exit()
-
-        # pause logic for miner 1
-        if event == "pause_1":
-            await miner_list[0].pause()
-        # resume logic for miner 1
-        if event == "resume_1":
-            await miner_list[0].resume()
-
-        # pause logic for miner 2
-        if event == "pause_2":
-            await miner_list[1].pause()
-        # resume logic for miner 2
-        if event == "resume_2":
-            await miner_list[1].resume()
-
-        # pause logic for miner 3
-        if event == "pause_3":
-            await miner_list[2].pause()
-        # resume logic for miner 3
-        if event == "resume_3":
-            await miner_list[2].resume()
-
-        # pause logic for miner 4
-        if event == "pause_4":
-            await miner_list[3].pause()
-        # resume logic for miner 4
-        if event == "resume_4":
-            await miner_list[3].resume()
-
-
-# declare all miners to be used in the GUI
-miner1 = Miner('192.168.1.11', 1)
-miner2 = Miner('192.168.1.12', 2)
-miner3 = Miner('192.168.1.13', 3)
-miner4 = Miner('192.168.1.14', 4)
-
-# create a list of the miners
-miners = [miner1, miner2, miner3, miner4]
-
-# create futures list for the miner to be run from
-futures = [run(miner) for miner in miners]
-futures.append(run_gui(miners))
-
-# run the event loop
-asyncio.get_event_loop().run_until_complete(asyncio.gather(*futures))
+            return
+
+        # poll quickly again if the user clicked something, otherwise back off until there is activity
+        poll_interval = GUI_IDLE_POLL_INTERVAL if event == sg.TIMEOUT_KEY else GUI_POLL_INTERVAL
+
+        # flush buffered output for each miner to its multiline in one update
+        for miner in miner_list:
+            output_buffer = output_buffers[miner.num]
+            if output_buffer:
+                poll_interval = GUI_POLL_INTERVAL
+                output = window[f"data_{miner.num}"]
+                output.update("".join(f"{line}\n" for line in output_buffer), append=True)
+                output_buffer.clear()
+                # trim the oldest lines so the multiline doesnt keep growing
+                widget = output.Widget
+                if int(widget.index('end-1c').split('.')[0]) > MAX_OUTPUT_LINES:
+                    # the multiline is disabled, so it has to be enabled to be edited
+                    widget.configure(state='normal')
+                    widget.delete('1.0', f'end-{MAX_OUTPUT_LINES}l')
+                    widget.configure(state='disabled')
+
+        # find and run the handler for the event, if there is one
+        handler = handlers.get(event)
+        if handler is not None:
+            await handler()
+
+
+async def main(headless: bool = False) -> None:
+    """
+    Create the miners and run them, alongside the GUI unless running headless
+    """
+    # create the limit on ssh operations shared by all miners
+    ssh_limit = asyncio.Semaphore(SSH_CONCURRENCY)
+
+    # create an output buffer for each miner, the GUI empties these, without the GUI output is printed
+    # the multiline only keeps MAX_OUTPUT_LINES, so any more than that since the last tick would be trimmed anyway
+    output_buffers = {num: deque(maxlen=MAX_OUTPUT_LINES) for num in range(1, len(MINER_IPS) + 1)}
+
+    # create a list of the miners, numbered from 1, done inside the loop so their events belong to it
+    miners = [Miner(ip, num, ssh_limit, print if headless else output_buffers[num].append)
+              for num, ip in enumerate(MINER_IPS, 1)]
+
+    # create tasks list for the miners to be run from, and the GUI
+    tasks = [asyncio.create_task(run(miner)) for miner in miners]
+    tasks.append(asyncio.create_task(ping_all(miners)))
+    window = None
+    if not headless:
+        window = create_window(len(miners))
+        tasks.append(asyncio.create_task(run_gui(window, miners, output_buffers)))
+
+    # stop the same way on ctrl+c or a terminate signal, windows doesnt support signal handlers on the loop
+    shutdown = asyncio.Event()
+    for shutdown_signal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(shutdown_signal, shutdown.set)
+        except NotImplementedError:
+            pass
+    tasks.append(asyncio.create_task(shutdown.wait()))
+
+    try:
+        # run until the GUI is closed, a task fails, or we are told to stop
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        # raise the error from a failed task, if there is one
+        for task in done:
+            task.result()
+    finally:
+        # stop every task that is still running and wait for them to finish
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # close all connections to the miners, one failing to close shouldnt stop the others
+        await asyncio.gather(*(miner.close() for miner in miners), return_exceptions=True)
+        if window is not None:
+            window.close()
+
+
+if __name__ == "__main__":
+    # use uvloop (winloop on windows) as the event loop where it is available
+    if uvloop is not None:
+        uvloop.install()
+
+    # run the event loop, --headless prints output instead of showing the GUI
+    asyncio.run(main("--headless" in sys.argv))